@@ -4,10 +4,19 @@ chat_gui_pro_tagged_full_tagged.py
 Tam versiya — Tag-aware, round-robin, AppData-based logo & DB, Tkinter GUI.
 Yeni: avtomatik tag inferrence, tag-summary yenilənməsi və tag-sualı yaratma.
 """
+import gc
+import hashlib
+import heapq
 import json
+import lzma
 import os
+import random
 import shutil
 import re
+import sys
+import time
+import zlib
+from collections import Counter, OrderedDict, deque
 from datetime import datetime
 from difflib import SequenceMatcher
 import tkinter as tk
@@ -45,6 +54,8 @@ except Exception:
 
 DB_PATH = os.path.join(SIMFUT_DIR, "simfut_db.json")
 LOG_PATH = os.path.splitext(DB_PATH)[0] + ".chat.log"
+SESSIONS_PATH = os.path.join(SIMFUT_DIR, "sessions.json")
+HOT_QUERIES_PATH = os.path.join(SIMFUT_DIR, "hot_queries.json")
 APPDATA_LOGO_PNG = os.path.join(SIMFUT_DIR, "logo.png")
 APPDATA_LOGO_ICO = os.path.join(SIMFUT_DIR, "logo.ico")
 LOCAL_DEFAULT_LOGO = os.path.join(os.path.dirname(__file__), "logo.png")
@@ -148,14 +159,26 @@ def load_db(path=DB_PATH):
         return {"meta": {"creation_date": "17.12.2024"}, "suallar": []}
 
 def save_db(db, path=DB_PATH):
+    """
+    Write db atomically (tmp file + os.replace). Returns ((mtime_ns, size), sha1) of
+    the bytes written, for DBWatcher.mark_synced(), or None when the write failed.
+    """
     try:
         dirpath = os.path.dirname(path)
         if dirpath and not os.path.exists(dirpath):
             os.makedirs(dirpath, exist_ok=True)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(db, f, ensure_ascii=False, indent=2)
+        raw = json.dumps(db, ensure_ascii=False, indent=2, default=_json_default).encode("utf-8")
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(raw)
+            f.flush()
+            st = os.fstat(f.fileno())
+        # rename keeps mtime and size, so this is the stat the watcher will see
+        os.replace(tmp, path)
+        return (st.st_mtime_ns, st.st_size), hashlib.sha1(raw).hexdigest()
     except Exception as e:
         messagebox.showerror("Xəta", f"Veritabanı yazılarkən xəta: {e}")
+        return None
 
 def backup_db(path=DB_PATH):
     if not os.path.exists(path):
@@ -176,17 +199,61 @@ def normalize_text(s: str) -> str:
     return s.strip().casefold()
 
 # ---------- Matching ----------
-def fuzzy_best_matches(query, corpus, limit=5):
+_DEADLINE_CHUNK = 256  # candidates scored between two deadline checks
+
+def fuzzy_best_matches(query, corpus, limit=5, cutoff=None, deadline=None):
+    """
+    Top `limit` (text, score) pairs with score in 0..1, best first.
+    With a cutoff only candidates scoring >= cutoff are returned; the SequenceMatcher
+    path then skips candidates whose cheap upper bounds (length ratio,
+    i.e. real_quick_ratio, then quick_ratio) cannot reach the cutoff or the current top-k.
+    With a deadline (time.perf_counter() value) scoring stops once it passes and the
+    best candidates seen so far are returned.
+    """
     if _RAPIDFUZZ:
-        res = process.extract(query, corpus, scorer=fuzz.WRatio, limit=limit)
+        kw = {} if cutoff is None else {"score_cutoff": cutoff * 100.0}
+        if deadline is None:
+            res = process.extract(query, corpus, scorer=fuzz.WRatio, limit=limit, **kw)
+        else:
+            res = []
+            for i in range(0, len(corpus), _DEADLINE_CHUNK):
+                res.extend(process.extract(query, corpus[i:i+_DEADLINE_CHUNK], scorer=fuzz.WRatio, limit=limit, **kw))
+                if time.perf_counter() >= deadline:
+                    break
+            res = sorted(res, key=lambda r: r[1], reverse=True)[:limit]
         return [(r[0], float(r[1]) / 100.0) for r in res]
-    else:
-        scored = []
-        for c in corpus:
-            ratio = SequenceMatcher(None, query, c).ratio()
-            scored.append((c, ratio))
-        scored.sort(key=lambda x: x[1], reverse=True)
-        return scored[:limit]
+    if limit <= 0:
+        return []
+    floor = cutoff if cutoff is not None else 0.0
+    lq = len(query)
+    sm = SequenceMatcher(None)
+    sm.set_seq1(query)
+    heap = []  # (score, -position, text): heap[0] is the weakest kept, later ones lose ties
+    for pos, c in enumerate(corpus):
+        if deadline is not None and pos % _DEADLINE_CHUNK == 0 and pos and time.perf_counter() >= deadline:
+            break
+        # the score a candidate must beat: ties with a full heap keep the earlier text
+        full = len(heap) >= limit
+        bar = heap[0][0] if full else floor
+        lc = len(c)
+        # ratio <= 2*min/(len sum); same bound as real_quick_ratio, without the call
+        total = lq + lc
+        bound = 2.0 * min(lq, lc) / total if total else 1.0
+        if bound < bar or (full and bound <= bar):
+            continue
+        sm.set_seq2(c)
+        q = sm.quick_ratio()
+        if q < bar or (full and q <= bar):
+            continue
+        r = sm.ratio()
+        if r < floor:
+            continue
+        if not full:
+            heapq.heappush(heap, (r, -pos, c))
+        elif r > bar:
+            heapq.heapreplace(heap, (r, -pos, c))
+    heap.sort(key=lambda x: (-x[0], -x[1]))
+    return [(c, r) for r, _, c in heap]
 
 # ---------- Age compute ----------
 def compute_age_from_date_string(date_str):
@@ -206,14 +273,20 @@ def compute_age_from_date_string(date_str):
         return None, None
 
 # ---------- Tag summary & helpers ----------
+def _is_tag_summary(it):
+    """True for the synthetic entry written by update_tag_summary (sual == tag)."""
+    tag = (it.get("tag") or "").strip()
+    return bool(tag) and normalize_text(it.get("sual","")) == normalize_text(tag)
+
 def _collect_answers_for_tag(db, tag):
-    """Return list of cavab values for entries with matching tag."""
-    return [it.get("cavab","") for it in db.get("suallar", []) if (it.get("tag") or "").strip().casefold() == (tag or "").strip().casefold()]
+    """Return list of cavab values for entries with matching tag (the summary itself excluded)."""
+    return [answer_text(it.get("cavab","")) for it in db.get("suallar", []) if (it.get("tag") or "").strip().casefold() == (tag or "").strip().casefold() and not _is_tag_summary(it)]
 
-def update_tag_summary(db, tag):
+def update_tag_summary(db, tag, save=True):
     """
     Create or update a DB entry whose 'sual' equals the tag name.
     The 'cavab' will be concatenation of all answers in that tag and final marker '— Tag: <tag>'.
+    Pass save=False to only update the in-memory db.
     """
     if not tag:
         return
@@ -228,47 +301,380 @@ def update_tag_summary(db, tag):
     # find existing entry whose 'sual' equals tag_norm (case-insensitive)
     for it in db.get("suallar", []):
         if normalize_text(it.get("sual","")) == normalize_text(tag_norm):
-            it["cavab"] = summary
+            it["cavab"] = ANSWER_STORE.put(summary)
             it["tag"] = tag_norm  # keep meta consistent
-            save_db(db)
+            if save:
+                save_db(db)
             return
     # else append a new one
-    db.setdefault("suallar", []).append({"sual": tag_norm, "cavab": summary, "tag": tag_norm})
-    save_db(db)
+    db.setdefault("suallar", []).append({"sual": tag_norm, "cavab": ANSWER_STORE.put(summary), "tag": tag_norm})
+    if save:
+        save_db(db)
 
 def _gather_tags_from_db(db):
     return sorted({(it.get("tag") or "").strip() for it in db.get("suallar", []) if (it.get("tag") or "").strip()})
 
-# ---------- Tag-aware selection with round-robin ----------
-def select_answer(user_question, db, context=None, cutoff=0.6, active_tag=None, round_robin_store=None):
-    qn = normalize_text(user_question)
+# ---------- Near-duplicate detection & compaction ----------
+_MINHASH_PRIME = (1 << 61) - 1
 
-    age_triggers = ("nece yasin var", "necə yaşın", "niye deqiq demirsen yasini", "necə yaşın var", "nece yashin var", "nece yashin var?")
-    for trig in age_triggers:
-        if trig in qn:
-            cd = db.get("meta", {}).get("creation_date")
-            if not cd:
-                for it in db.get("suallar", []):
-                    m = re.search(r"(\d{1,2}\.\d{1,2}\.\d{4})", it.get("cavab",""))
-                    if m:
-                        cd = m.group(1); break
-            if not cd: cd = "17.12.2024"
-            created_str, parts = compute_age_from_date_string(cd)
-            if created_str:
-                return f"Mən fiziki bədənə malik olmayan virtual süni intellektəm; yaradılma tarixim {created_str} və bu vaxta qədər: {parts}."
-            else:
-                return "Yaşımı hesablamaq üçün yaradılma tarixi düzgün deyil."
+def _shingles(text, k=3):
+    """Character k-shingles of the normalized text (punctuation and extra spaces dropped)."""
+    s = re.sub(r"[^\w\s]+", "", normalize_text(text))
+    s = re.sub(r"\s+", " ", s).strip()
+    if len(s) <= k:
+        return {s}
+    return {s[i:i+k] for i in range(len(s) - k + 1)}
 
-    candidates = db.get("suallar", [])
+def _minhash_params(num_perm, seed=17):
+    rnd = random.Random(seed)
+    return [(rnd.randrange(1, _MINHASH_PRIME), rnd.randrange(0, _MINHASH_PRIME)) for _ in range(num_perm)]
 
-    def filter_by_tag(cands, tag):
-        if not tag or tag.lower() in ("", "auto"):
-            return cands
-        return [c for c in cands if normalize_text(c.get("tag","") or "") == normalize_text(tag)]
+def minhash_signature(shingles, params):
+    hashes = [zlib.crc32(sh.encode("utf-8")) for sh in shingles]
+    return tuple(min((a * h + b) % _MINHASH_PRIME for h in hashes) for a, b in params)
 
-    def answers_for_question(cands, question_text):
-        return [c for c in cands if normalize_text(c.get("sual","")) == normalize_text(question_text)]
+def find_near_duplicates(texts, threshold=0.8, num_perm=64, bands=16):
+    """
+    Cluster near-identical texts with MinHash + LSH banding.
+    Bucket collisions are only candidates; a pair is merged when the real Jaccard
+    similarity of the shingle sets is >= threshold. Returns clusters as lists of indexes.
+    """
+    rows = max(1, num_perm // bands)
+    params = _minhash_params(rows * bands)
+    shingle_sets = [_shingles(t) for t in texts]
+    parent = list(range(len(texts)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    buckets = {}
+    for i, sh in enumerate(shingle_sets):
+        sig = minhash_signature(sh, params)
+        for b in range(bands):
+            buckets.setdefault((b, sig[b*rows:(b+1)*rows]), []).append(i)
+
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        for pos, i in enumerate(members):
+            for j in members[pos+1:]:
+                ri, rj = find(i), find(j)
+                if ri == rj:
+                    continue
+                a, b = shingle_sets[i], shingle_sets[j]
+                if len(a & b) / float(len(a | b) or 1) >= threshold:
+                    parent[max(ri, rj)] = min(ri, rj)
+
+    clusters = {}
+    for i in range(len(texts)):
+        clusters.setdefault(find(i), []).append(i)
+    return sorted(clusters.values(), key=lambda c: c[0])
+
+def compact_db(db, threshold=0.8, answer_threshold=0.9):
+    """
+    Build a compacted copy of db:
+      - near-duplicate questions within one tag are merged under one canonical 'sual',
+        so their answers form a multi-answer group served by the usual round-robin;
+      - near-duplicate answers inside such a group are dropped;
+      - tag-summary entries are regenerated from the surviving answers.
+    Returns (new_db, merges) where merges describes every proposed merge.
+    """
+    entries = db.get("suallar", [])
+    summary_tags = []
+    by_tag = {}
+    for it in entries:
+        if _is_tag_summary(it):
+            summary_tags.append(it.get("tag","").strip())
+            continue
+        by_tag.setdefault(normalize_text(it.get("tag","") or ""), []).append(it)
+
+    groups = []  # (first position in db, canonical sual, entries)
+    position = {id(it): i for i, it in enumerate(entries)}
+    for tag_entries in by_tag.values():
+        clusters = find_near_duplicates([it.get("sual","") for it in tag_entries], threshold)
+        for cl in clusters:
+            members = [tag_entries[i] for i in cl]
+            counts = {}
+            for it in members:
+                counts[it.get("sual","")] = counts.get(it.get("sual",""), 0) + 1
+            # most frequent spelling wins, the earliest one on ties
+            canonical = max(counts, key=lambda q: counts[q])
+            groups.append((position[id(members[0])], canonical, members))
+    groups.sort(key=lambda g: g[0])
+
+    new_entries = []
+    merges = []
+    for _, canonical, members in groups:
+        answers = [answer_text(it.get("cavab","")) for it in members]
+        kept = [members[cl[0]] for cl in find_near_duplicates(answers, answer_threshold)]
+        for it in kept:
+            new_it = dict(it)
+            new_it["sual"] = canonical
+            new_entries.append(new_it)
+        merged = sorted({it.get("sual","") for it in members} - {canonical})
+        if merged or len(kept) < len(members):
+            merges.append({
+                "sual": canonical,
+                "tag": members[0].get("tag","") or "",
+                "merged": merged,
+                "answers_before": len(members),
+                "answers_after": len(kept),
+            })
+
+    new_db = dict(db)
+    new_db["meta"] = dict(db.get("meta", {}))
+    new_db["suallar"] = new_entries
+    for tag in summary_tags:
+        update_tag_summary(new_db, tag, save=False)
+    return new_db, merges
+
+def _time_fuzzy(queries, corpus, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for q in queries:
+            fuzzy_best_matches(q, corpus, limit=5)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best or 0.0
+
+def compaction_report(old_db, new_db, queries=None, repeat=3):
+    """Size and fuzzy-latency comparison between the original and the compacted db."""
+    def stats(d):
+        items = d.get("suallar", [])
+        return {
+            "entries": len(items),
+            "questions": len({normalize_text(it.get("sual","")) for it in items}),
+            "chars": sum(len(it.get("sual","")) + len(answer_text(it.get("cavab","")) or "") for it in items),
+            "bytes": len(json.dumps(d, ensure_ascii=False, indent=2, default=_json_default).encode("utf-8")),
+        }
+    # same corpus shape select_answer scores: one string per distinct question
+    old_corpus = list(dict.fromkeys(it.get("sual","") for it in old_db.get("suallar", [])))
+    new_corpus = list(dict.fromkeys(it.get("sual","") for it in new_db.get("suallar", [])))
+    if queries is None:
+        queries = random.Random(0).sample(old_corpus, min(200, len(old_corpus)))
+    before, after = stats(old_db), stats(new_db)
+    t_before = _time_fuzzy(queries, old_corpus, repeat)
+    t_after = _time_fuzzy(queries, new_corpus, repeat)
+    n = float(len(queries) or 1)
+    return {
+        "before": before,
+        "after": after,
+        "entries_saved_pct": 100.0 * (1 - after["entries"] / float(before["entries"] or 1)),
+        "bytes_saved_pct": 100.0 * (1 - after["bytes"] / float(before["bytes"] or 1)),
+        "fuzzy_ms_per_query_before": 1000.0 * t_before / n,
+        "fuzzy_ms_per_query_after": 1000.0 * t_after / n,
+        "latency_gain_pct": 100.0 * (1 - t_after / t_before) if t_before else 0.0,
+    }
+
+def run_compaction(path=DB_PATH, out_path=None, threshold=0.8, answer_threshold=0.9):
+    """Offline job: compact the db at path, write it next to it and print the report."""
+    db = load_db(path)
+    new_db, merges = compact_db(db, threshold, answer_threshold)
+    out_path = out_path or os.path.splitext(path)[0] + ".compact.json"
+    save_db(new_db, out_path)
+    rep = compaction_report(db, new_db)
+    for m in merges:
+        extra = f" <- {', '.join(m['merged'])}" if m["merged"] else ""
+        print(f"[{m['tag'] or '-'}] {m['sual']}{extra}  (cavab: {m['answers_before']} -> {m['answers_after']})")
+    b, a = rep["before"], rep["after"]
+    print(f"Entries: {b['entries']} -> {a['entries']} ({rep['entries_saved_pct']:.1f}% kiçik)")
+    print(f"Suallar: {b['questions']} -> {a['questions']}")
+    print(f"Ölçü: {b['bytes']} -> {a['bytes']} bayt ({rep['bytes_saved_pct']:.1f}% kiçik)")
+    print(f"Fuzzy: {rep['fuzzy_ms_per_query_before']:.3f} -> {rep['fuzzy_ms_per_query_after']:.3f} ms/sual ({rep['latency_gain_pct']:.1f}% sürətli)")
+    print(f"Yazıldı: {out_path}")
+    return out_path, rep
+
+# ---------- Typo correction (symmetric delete) ----------
+SPELL_MAX_DISTANCE = 2
+_WORD_RE = re.compile(r"\w+")
+
+def _tokens(text):
+    return _WORD_RE.findall(normalize_text(text or ""))
+
+def _deletes(word, max_distance):
+    """All strings reachable from word by deleting up to max_distance characters (word included)."""
+    out = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        nxt = set()
+        for w in frontier:
+            for i in range(len(w)):
+                nxt.add(w[:i] + w[i+1:])
+        frontier = nxt - out
+        out |= frontier
+    return out
+
+def _edit_distance(a, b, max_distance):
+    """Optimal string alignment distance, or max_distance + 1 once it is known to be larger."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i-1] == b[j-1] else 1
+            cur[j] = min(prev[j] + 1, cur[j-1] + 1, prev[j-1] + cost)
+            if i > 1 and j > 1 and a[i-1] == b[j-2] and a[i-2] == b[j-1]:
+                cur[j] = min(cur[j], prev2[j-2] + 1)
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+class SpellIndex:
+    """
+    SymSpell-style corrector over the words of all 'sual' texts.
+    Every vocabulary word is indexed under its deletes (of its first prefix_length
+    characters) up to max_distance; a lookup only generates the deletes of the query
+    word and verifies the few words sharing one, so its cost does not grow with the
+    vocabulary. Words shorter than min_length are never corrected, and words shorter
+    than short_length by at most one edit.
+    """
+    def __init__(self, max_distance=SPELL_MAX_DISTANCE, prefix_length=7, min_length=3, short_length=5):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.min_length = min_length
+        self.short_length = short_length
+        self.words = Counter()
+        self.questions = {}  # "token token" -> Counter of 'sual' texts
+        self._deletes = {}   # delete -> word, or set of words when several share it
+
+    def _variants(self, word, max_distance=None):
+        return _deletes(word[:self.prefix_length], self.max_distance if max_distance is None else max_distance)
+
+    def allowed_distance(self, word):
+        return min(self.max_distance, 1) if len(word) < self.short_length else self.max_distance
+
+    def add_text(self, text):
+        toks = _tokens(text)
+        self.questions.setdefault(" ".join(toks), Counter())[text] += 1
+        for w in toks:
+            self.words[w] += 1
+            if self.words[w] == 1:
+                for v in self._variants(w):
+                    cur = self._deletes.get(v)
+                    if cur is None:
+                        self._deletes[v] = w
+                    elif isinstance(cur, set):
+                        cur.add(w)
+                    elif cur != w:
+                        self._deletes[v] = {cur, w}
+
+    def remove_text(self, text):
+        toks = _tokens(text)
+        key = " ".join(toks)
+        qs = self.questions.get(key)
+        if qs is not None:
+            qs[text] -= 1
+            if qs[text] <= 0:
+                del qs[text]
+            if not qs:
+                del self.questions[key]
+        for w in toks:
+            if self.words[w] > 1:
+                self.words[w] -= 1
+                continue
+            self.words.pop(w, None)
+            for v in self._variants(w):
+                cur = self._deletes.get(v)
+                if isinstance(cur, set):
+                    cur.discard(w)
+                    if len(cur) == 1:
+                        self._deletes[v] = cur.pop()
+                elif cur == w:
+                    del self._deletes[v]
+
+    def rebuild(self, texts):
+        self.words.clear()
+        self.questions.clear()
+        self._deletes.clear()
+        for t in texts:
+            self.add_text(t)
+
+    def lookup(self, word):
+        """Best (word, distance) for word, or None; ties go to the more frequent word."""
+        if word in self.words:
+            return word, 0
+        if len(word) < self.min_length or word.isdigit():
+            return None
+        best = None
+        seen = set()
+        limit = self.allowed_distance(word)
+        for v in self._variants(word, limit):
+            cur = self._deletes.get(v)
+            for cand in ((cur,) if isinstance(cur, str) else (cur or ())):
+                if cand in seen:
+                    continue
+                seen.add(cand)
+                d = _edit_distance(word, cand, limit)
+                if d > limit:
+                    continue
+                rank = (d, -self.words[cand], cand)
+                if best is None or rank < best:
+                    best = rank
+        return (best[2], best[0]) if best else None
+
+    def correct(self, text):
+        """Token key ("word word") of text with every unknown word replaced by its correction."""
+        out = []
+        for w in _tokens(text):
+            hit = self.lookup(w)
+            out.append(hit[0] if hit else w)
+        return " ".join(out)
+
+    def stats(self):
+        """Vocabulary size and an estimate of the index memory in bytes."""
+        size = sys.getsizeof(self._deletes) + sys.getsizeof(self.words)
+        for k, v in self._deletes.items():
+            # single-word buckets share the vocabulary string
+            size += sys.getsizeof(k) + (sys.getsizeof(v) if isinstance(v, set) else 0)
+        for w in self.words:
+            size += sys.getsizeof(w)
+        return {"words": len(self.words), "deletes": len(self._deletes), "bytes": size, "max_distance": self.max_distance}
+
+def _typo(word, rnd):
+    i = rnd.randrange(len(word))
+    op = rnd.randrange(3)
+    if op == 0:
+        return word[:i] + word[i+1:]
+    if op == 1:
+        return word[:i] + rnd.choice("abcdefghijklmnopqrstuvwxyzəüöğışç") + word[i+1:]
+    return word[:i] + word[i:i+2][::-1] + word[i+2:]
+
+def run_spell_stats(db_path=DB_PATH, max_distance=SPELL_MAX_DISTANCE, samples=2000):
+    """Offline job: build the spell index from the db, print its size and lookup time."""
+    db = load_db(db_path)
+    idx = SpellIndex(max_distance=int(max_distance))
+    t0 = time.perf_counter()
+    idx.rebuild(it.get("sual","") for it in db.get("suallar", []))
+    build = time.perf_counter() - t0
+    st = idx.stats()
+    vocab = [w for w in idx.words if len(w) > idx.min_length]
+    rnd = random.Random(0)
+    queries = [_typo(rnd.choice(vocab), rnd) for _ in range(int(samples))] if vocab else []
+    t0 = time.perf_counter()
+    fixed = sum(1 for q in queries if idx.lookup(q))
+    per = (time.perf_counter() - t0) / float(len(queries) or 1)
+    print(f"Söz: {st['words']}, delete açarı: {st['deletes']}, yaddaş: ~{st['bytes'] / 1024.0:.1f} KB (məsafə {st['max_distance']})")
+    print(f"Qurulma: {build * 1000:.1f} ms, axtarış: {per * 1e6:.1f} µs/söz, düzəldilən: {fixed}/{len(queries)}")
+    return st
 
+# ---------- Tag-aware selection with round-robin ----------
+HOT_QUERIES = {}  # normalized query -> 'sual' it resolves to, filled by load_hot_queries()
+
+AGE_TRIGGERS = ("nece yasin var", "necə yaşın", "niye deqiq demirsen yasini", "necə yaşın var", "nece yashin var", "nece yashin var?")
+
+def _filter_by_tag(cands, tag):
+    if not tag or tag.lower() in ("", "auto"):
+        return cands
+    return [c for c in cands if normalize_text(c.get("tag","") or "") == normalize_text(tag)]
+
+def _choose_tag(active_tag, context):
     chosen_tag = active_tag
     if not chosen_tag or normalize_text(str(chosen_tag)) == "auto":
         chosen_tag = None
@@ -280,55 +686,894 @@ def select_answer(user_question, db, context=None, cutoff=0.6, active_tag=None,
                     break
         if not chosen_tag:
             chosen_tag = "auto"
+    return chosen_tag
+
+def _pick_round_robin(entries, key, store):
+    if not entries:
+        return None
+    idx = 0
+    if store is not None:
+        idx = store.get(key, 0) % len(entries)
+        store[key] = (idx + 1) % len(entries)
+    return entries[idx].get("cavab")
+
+class MatchQuery:
+    """Per-question state shared by the pipeline stages."""
+    def __init__(self, question, db, context=None, cutoff=0.6, active_tag=None, round_robin_store=None, spell_index=None):
+        self.question = question
+        self.qn = normalize_text(question)
+        self.db = db
+        self.candidates = db.get("suallar", [])
+        self.context = context
+        self.cutoff = cutoff
+        self.round_robin_store = round_robin_store
+        self.spell_index = spell_index  # SpellIndex over db's questions, or None
+        self.chosen_tag = _choose_tag(active_tag, context)
+        self.cands_tagged = _filter_by_tag(self.candidates, None if self.chosen_tag == "auto" else self.chosen_tag)
+        self.deadline = None    # perf_counter() limit of the running stage
+        self.partial = False    # a stage stopped scoring at its deadline
+        self.matches = []       # fuzzy candidates for the UI list
+        self.suggestion = None  # answer shown as a suggestion, not as the reply
+
+def _note_partial(mq):
+    # fuzzy_best_matches stops at the deadline without saying so; past it the top-k may be incomplete
+    if mq.deadline is not None and time.perf_counter() >= mq.deadline:
+        mq.partial = True
+
+def _fuzzy_round_robin(mq, stage, cands, tag_key):
+    # distinct questions only: duplicates form one round-robin group anyway
+    corpus = list(dict.fromkeys(it.get("sual","") for it in cands))
+    if stage.limit:
+        corpus = corpus[:stage.limit]
+    if not corpus:
+        return None
+    matches = fuzzy_best_matches(mq.question, corpus, limit=5, cutoff=mq.cutoff, deadline=mq.deadline)
+    _note_partial(mq)
+    if not matches:
+        return None
+    best_text = matches[0][0]
+    matched_entries = [it for it in cands if it.get("sual","") == best_text]
+    return _pick_round_robin(matched_entries, (normalize_text(best_text), tag_key), mq.round_robin_store)
+
+def _stage_age(mq, stage):
+    for trig in AGE_TRIGGERS:
+        if trig in mq.qn:
+            cd = mq.db.get("meta", {}).get("creation_date")
+            if not cd:
+                for it in mq.candidates:
+                    m = re.search(r"(\d{1,2}\.\d{1,2}\.\d{4})", answer_text(it.get("cavab","")) or "")
+                    if m:
+                        cd = m.group(1); break
+            if not cd: cd = "17.12.2024"
+            created_str, parts = compute_age_from_date_string(cd)
+            if created_str:
+                return f"Mən fiziki bədənə malik olmayan virtual süni intellektəm; yaradılma tarixim {created_str} və bu vaxta qədər: {parts}."
+            else:
+                return "Yaşımı hesablamaq üçün yaradılma tarixi düzgün deyil."
+    return None
+
+def _stage_tag_exact(mq, stage):
+    exact_tagged = [c for c in mq.cands_tagged if normalize_text(c.get("sual","")) == mq.qn]
+    return _pick_round_robin(exact_tagged, (mq.qn, normalize_text(mq.chosen_tag or "")), mq.round_robin_store)
+
+def _stage_spell(mq, stage):
+    """
+    Correct typos word by word and retry the exact match with the corrected question.
+    The matched 'sual' must still score >= cutoff against what the user typed.
+    """
+    # also catches questions that differ only in punctuation
+    if mq.spell_index is None:
+        return None
+    corrected = mq.spell_index.correct(mq.question)
+    suals = mq.spell_index.questions.get(corrected)
+    if not suals:
+        return None
+    best, best_score = None, mq.cutoff
+    for q in suals:
+        score = SequenceMatcher(None, mq.qn, normalize_text(q)).ratio()
+        if score >= best_score and (best is None or score > best_score):
+            best, best_score = q, score
+    if best is None:
+        return None
+    exact = [c for c in mq.cands_tagged if c.get("sual","") == best]
+    return _pick_round_robin(exact, (normalize_text(best), normalize_text(mq.chosen_tag or "")), mq.round_robin_store)
+
+def _stage_tag_fuzzy(mq, stage):
+    return _fuzzy_round_robin(mq, stage, mq.cands_tagged, normalize_text(mq.chosen_tag or ""))
 
-    # 1) exact match within chosen_tag
-    cands_tagged = filter_by_tag(candidates, None if chosen_tag == "auto" else chosen_tag)
-    exact_tagged = answers_for_question(cands_tagged, user_question)
-    if exact_tagged:
-        key = (normalize_text(user_question), normalize_text(chosen_tag or ""))
-        idx = 0
-        if round_robin_store is not None:
-            idx = round_robin_store.get(key, 0) % len(exact_tagged)
-            round_robin_store[key] = (idx + 1) % len(exact_tagged)
-        return exact_tagged[idx].get("cavab")
-
-    # 2) fuzzy within chosen_tag
-    corpus_tagged = [it.get("sual","") for it in cands_tagged]
-    if corpus_tagged:
-        matches = fuzzy_best_matches(user_question, corpus_tagged, limit=5)
-        if matches and matches[0][1] >= cutoff:
-            best_text = matches[0][0]
-            matched_entries = [it for it in cands_tagged if it.get("sual","") == best_text]
-            key = (normalize_text(best_text), normalize_text(chosen_tag or ""))
-            idx = 0
-            if round_robin_store is not None and matched_entries:
-                idx = round_robin_store.get(key, 0) % len(matched_entries)
-                round_robin_store[key] = (idx + 1) % len(matched_entries)
-            if matched_entries:
-                return matched_entries[idx].get("cavab")
-
-    # 3) fallback: global exact
-    for it in candidates:
-        if normalize_text(it.get("sual","")) == qn:
+def _stage_global_exact(mq, stage):
+    for it in mq.candidates:
+        if normalize_text(it.get("sual","")) == mq.qn:
             return it.get("cavab")
+    return None
 
-    # 4) fallback: global fuzzy
-    corpus = [it.get("sual","") for it in candidates]
-    if corpus:
-        matches = fuzzy_best_matches(user_question, corpus, limit=5)
-        if matches and matches[0][1] >= cutoff:
-            best_text = matches[0][0]
-            matched_entries = [it for it in candidates if it.get("sual","") == best_text]
-            key = (normalize_text(best_text), "")
-            idx = 0
-            if round_robin_store is not None and matched_entries:
-                idx = round_robin_store.get(key, 0) % len(matched_entries)
-                round_robin_store[key] = (idx + 1) % len(matched_entries)
-            if matched_entries:
-                return matched_entries[idx].get("cavab")
+def _stage_global_fuzzy(mq, stage):
+    return _fuzzy_round_robin(mq, stage, mq.candidates, "")
+
+def _stage_suggest(mq, stage):
+    """Fill the candidate list for the UI; a good enough one becomes a suggestion."""
+    corpus = [it.get("sual","") for it in mq.candidates]
+    if stage.limit:
+        corpus = corpus[:stage.limit]
+    mq.matches = fuzzy_best_matches(mq.question, corpus, limit=5, deadline=mq.deadline)
+    _note_partial(mq)
+    if mq.matches and mq.matches[0][1] >= mq.cutoff:
+        best = mq.matches[0][0]
+        for it in mq.candidates:
+            if it.get("sual","") == best:
+                mq.suggestion = it.get("cavab")
+                break
+    return None
+
+def _stage_hot(mq, stage):
+    """
+    Precomputed answers for frequent queries (see mine_chat_log): jump straight to their question.
+    The table is mined at the default cutoff, so the target is re-scored against mq.cutoff
+    with the fuzzy tiers' scorer before it is used.
+    """
+    target = HOT_QUERIES.get(mq.qn)
+    if not target or not fuzzy_best_matches(mq.question, [target], limit=1, cutoff=mq.cutoff):
+        return None
+    entries = [it for it in mq.cands_tagged if it.get("sual","") == target]
+    # same counter key as tag_exact, so the rotation continues across both stages
+    return _pick_round_robin(entries, (normalize_text(target), normalize_text(mq.chosen_tag or "")), mq.round_robin_store)
+
+class MatchStage:
+    """One matcher tier: fn(query, stage) returns an answer or None."""
+    __slots__ = ("name", "fn", "limit", "budget")
 
+    def __init__(self, name, fn, limit=None, budget=None):
+        self.name = name
+        self.fn = fn
+        self.limit = limit    # max corpus strings the stage may score (None = all)
+        self.budget = budget  # seconds (None = no limit)
+
+class MatchResult:
+    __slots__ = ("answer", "stage", "suggestion", "matches", "timed_out", "partial", "elapsed")
+
+    def __init__(self):
+        self.answer = None
+        self.stage = None
+        self.suggestion = None
+        self.matches = []
+        self.timed_out = False
+        self.partial = False  # some fuzzy stage was cut off by its budget
+        self.elapsed = 0.0
+
+class MatcherPipeline:
+    """
+    Runs matcher stages in order until one answers. Each stage gets its own time
+    budget (clipped to the overall deadline); stages that exceed it are counted in
+    stats["overruns"]. A fuzzy stage cut off by its budget sets partial: its answer may
+    not be the best match and a miss does not mean nothing matches. Once the deadline
+    is spent the result is returned as is, with timed_out set. suggest=False skips
+    the UI-only "suggest" stage. spell_index is the SpellIndex the "spell" stage
+    corrects against; whoever owns the db keeps it in step with the questions.
+    """
+    def __init__(self, stages, deadline=None, spell_index=None):
+        self.stages = list(stages)
+        self.deadline = deadline
+        self.spell_index = spell_index if spell_index is not None else SpellIndex()
+        self.stats = {"runs": 0, "deadline_hits": 0, "partial": 0, "hits": Counter(), "overruns": Counter()}
+
+    def stage(self, name):
+        for st in self.stages:
+            if st.name == name:
+                return st
+        raise KeyError(name)
+
+    def run(self, question, db, context=None, cutoff=0.6, active_tag=None, round_robin_store=None, suggest=True):
+        t0 = time.perf_counter()
+        end = t0 + self.deadline if self.deadline else None
+        mq = MatchQuery(question, db, context, cutoff, active_tag, round_robin_store, self.spell_index)
+        res = MatchResult()
+        self.stats["runs"] += 1
+        for st in self.stages:
+            if not suggest and st.name == "suggest":
+                continue
+            start = time.perf_counter()
+            if end is not None and start >= end:
+                res.timed_out = True
+                break
+            limits = [x for x in (start + st.budget if st.budget else None, end) if x is not None]
+            mq.deadline = min(limits) if limits else None
+            ans = st.fn(mq, st)
+            if st.budget and time.perf_counter() - start > st.budget:
+                self.stats["overruns"][st.name] += 1
+            if ans:
+                res.answer, res.stage = ans, st.name
+                self.stats["hits"][st.name] += 1
+                break
+        res.elapsed = time.perf_counter() - t0
+        if not res.answer and end is not None and t0 + res.elapsed >= end:
+            res.timed_out = True
+        if res.timed_out:
+            self.stats["deadline_hits"] += 1
+        res.partial = mq.partial
+        if res.partial:
+            self.stats["partial"] += 1
+        res.matches, res.suggestion = mq.matches, mq.suggestion
+        return res
+
+def default_pipeline(deadline=0.5, spell_index=None):
+    """The classic tiers: age, exact within the chosen tag, hot queries, typo-corrected/fuzzy within the tag, global exact/fuzzy, UI suggestion."""
+    return MatcherPipeline([
+        MatchStage("age", _stage_age),
+        MatchStage("tag_exact", _stage_tag_exact),
+        MatchStage("hot", _stage_hot),
+        MatchStage("spell", _stage_spell),
+        MatchStage("tag_fuzzy", _stage_tag_fuzzy, budget=0.15),
+        MatchStage("global_exact", _stage_global_exact),
+        MatchStage("global_fuzzy", _stage_global_fuzzy, budget=0.2),
+        MatchStage("suggest", _stage_suggest, budget=0.1),
+    ], deadline=deadline, spell_index=spell_index)
+
+MATCHER_PIPELINE = default_pipeline()
+
+def select_answer(user_question, db, context=None, cutoff=0.6, active_tag=None, round_robin_store=None):
+    res = MATCHER_PIPELINE.run(user_question, db, context=context, cutoff=cutoff,
+                               active_tag=active_tag, round_robin_store=round_robin_store, suggest=False)
+    return answer_text(res.answer)
+
+# ---------- Chat log miner ----------
+_LOG_LINE_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}T[\d:.]+) (.*?): (.*)$")
+_BOT_NOTICES = {
+    "Öyrədilmədi.": "unanswered",
+    "Yeni sual əlavə edildi.": "taught",
+    "Mövcud sual yeniləndi.": "taught",
+}
+
+def _iter_log_messages(path):
+    """Stream (who, text) pairs from a chat log; untimestamped lines continue the previous message."""
+    who = text = None
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            m = _LOG_LINE_RE.match(line)
+            if m:
+                if who is not None:
+                    yield who, text
+                who, text = m.group(2), m.group(3)
+            elif who is not None:
+                text += "\n" + line
+    if who is not None:
+        yield who, text
+
+def _classify_reply(who, text):
+    if who == "Simfut (təklif)":
+        return "suggestion"
+    if text in _BOT_NOTICES:
+        return _BOT_NOTICES[text]
+    if text.startswith("Hələ düşünürəm"):
+        return "timeout"
+    if text.startswith("Bunu nətər cavablayacağımı bilmirəm"):
+        return "unanswered"  # old console bot
+    if who in ("Simfut", "Bot"):
+        return "answered"
     return None
 
+def mine_chat_log(path=LOG_PATH, db=None, min_count=3, top=20):
+    """
+    Pair every 'Siz' line with the bot reply that follows it and count queries,
+    outcomes (answered / suggestion / unanswered / taught / timeout) and, when db is
+    given, the pipeline stage that answers each query now.
+    Returns a report dict; report["hot"] maps frequent answered queries that the
+    current db only resolves by fuzzy matching to the 'sual' they resolve to,
+    for load_hot_queries().
+    """
+    queries = Counter()
+    outcomes = Counter()
+    unanswered = Counter()
+    examples = {}
+    answered = set()
+    pending = None
+    for who, text in _iter_log_messages(path):
+        if who == "Siz":
+            if pending is not None:
+                outcomes["none"] += 1
+            pending = normalize_text(text)
+            queries[pending] += 1
+            examples.setdefault(pending, text)
+            continue
+        if pending is None:
+            continue
+        kind = _classify_reply(who, text)
+        if kind is None:
+            continue
+        outcomes[kind] += 1
+        if kind == "answered":
+            answered.add(pending)
+        elif kind in ("unanswered", "timeout", "suggestion"):
+            unanswered[pending] += 1
+        pending = None
+    if pending is not None:
+        outcomes["none"] += 1
+
+    stages = Counter()
+    hot = {}
+    still_unanswered = unanswered
+    if db is not None:
+        by_answer = {}
+        for it in db.get("suallar", []):
+            by_answer.setdefault(answer_key(it.get("cavab","")), []).append(it.get("sual",""))
+        # same typo correction the live app has, built from this db
+        replay = default_pipeline(deadline=None)
+        replay.spell_index.rebuild(it.get("sual","") for it in db.get("suallar", []))
+        replay.stages = [st for st in replay.stages if st.name != "hot"]
+        for st in replay.stages:
+            st.budget = None
+        answered_now = set()
+        for qn, n in queries.items():
+            res = replay.run(qn, db, suggest=False)
+            if not res.answer:
+                continue
+            stages[res.stage] += n
+            answered_now.add(qn)
+            # only fuzzy resolutions are worth precomputing; exact ones are already cheap
+            if n < min_count or qn not in answered or res.stage not in ("tag_fuzzy", "global_fuzzy"):
+                continue
+            suals = list(dict.fromkeys(by_answer.get(answer_key(res.answer), [])))
+            if len(suals) == 1:
+                hot[qn] = suals[0]
+            elif suals:
+                hot[qn] = fuzzy_best_matches(qn, suals, limit=1)[0][0]
+        still_unanswered = Counter({q: n for q, n in unanswered.items() if q not in answered_now})
+
+    return {
+        "queries": sum(queries.values()),
+        "distinct": len(queries),
+        "outcomes": dict(outcomes),
+        "stages": dict(stages),
+        "top_queries": [(examples[q], n) for q, n in queries.most_common(top)],
+        "top_unanswered": [(examples[q], n) for q, n in still_unanswered.most_common(top)],
+        "hot": hot,
+    }
+
+def save_hot_queries(hot, path=HOT_QUERIES_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(hot, f, ensure_ascii=False, indent=2)
+    return path
+
+def load_hot_queries(path=HOT_QUERIES_PATH):
+    """Load the precomputed hot-query table into HOT_QUERIES; a missing file leaves it empty."""
+    HOT_QUERIES.clear()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        HOT_QUERIES.update({normalize_text(k): v for k, v in data.items() if isinstance(v, str)})
+    except Exception:
+        pass
+    return len(HOT_QUERIES)
+
+def invalidate_hot_queries(added=(), removed=()):
+    """
+    Drop hot-table entries a db change may have made stale: targets that lost an
+    entry, queries that now have a question of their own, and queries a new
+    question matches at least as well as their target. Returns how many were dropped.
+    """
+    if not HOT_QUERIES:
+        return 0
+    gone = {it.get("sual","") for it in removed}
+    new = list(dict.fromkeys(it.get("sual","") for it in added))
+    new_norm = {normalize_text(q) for q in new}
+    stale = []
+    for qn, target in HOT_QUERIES.items():
+        if target in gone or qn in new_norm:
+            stale.append(qn)
+        elif new and fuzzy_best_matches(qn, [target] + new, limit=1)[0][0] != target:
+            stale.append(qn)
+    for qn in stale:
+        del HOT_QUERIES[qn]
+    return len(stale)
+
+def run_log_miner(log_path=LOG_PATH, db_path=DB_PATH, out_path=HOT_QUERIES_PATH, min_count=3):
+    """Offline job: mine the chat log, print the report and write the hot-query table."""
+    db = load_db(db_path)
+    rep = mine_chat_log(log_path, db, min_count=int(min_count))
+    print(f"Suallar: {rep['queries']} ({rep['distinct']} fərqli)")
+    print("Nəticələr: " + ", ".join(f"{k}={v}" for k, v in sorted(rep["outcomes"].items())))
+    if rep["stages"]:
+        print("Mərhələlər (indiki DB): " + ", ".join(f"{k}={v}" for k, v in sorted(rep["stages"].items())))
+    print("Ən çox verilən suallar:")
+    for q, n in rep["top_queries"]:
+        print(f"  {n:5d}  {q}")
+    print("Öyrətməyə dəyər (hələ cavabsız):")
+    for q, n in rep["top_unanswered"]:
+        print(f"  {n:5d}  {q}")
+    save_hot_queries(rep["hot"], out_path)
+    print(f"Hot cədvəl: {len(rep['hot'])} sual -> {out_path}")
+    return rep
+
+# ---------- Session state ----------
+class BoundedLRU(OrderedDict):
+    """Dict holding at most `maxsize` keys; the least recently used key is dropped first."""
+    def __init__(self, maxsize=256):
+        super().__init__()
+        self.maxsize = maxsize
+
+    def get(self, key, default=None):
+        if key in self:
+            self.move_to_end(key)
+            return super().__getitem__(key)
+        return default
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+class RoundRobinStore(BoundedLRU):
+    """
+    Bounded round-robin counters. Keys are reduced to a fixed 8-byte digest, so a
+    counter costs the same however long the question text is.
+    """
+    @staticmethod
+    def _digest(key):
+        return hashlib.blake2b(repr(key).encode("utf-8"), digest_size=8).digest()
+
+    def get(self, key, default=None):
+        return super().get(self._digest(key), default)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(self._digest(key), value)
+
+    def to_list(self):
+        return [[k.hex(), v] for k, v in self.items()]
+
+    def load_list(self, items):
+        for k, v in items:
+            BoundedLRU.__setitem__(self, bytes.fromhex(k), int(v))
+
+SESSION_WHO_MAX = 32
+
+def _deep_sizeof(obj):
+    """Bytes held by obj and everything it references (classes excluded), pymalloc-rounded."""
+    seen = set()
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, type):
+            continue
+        seen.add(id(o))
+        total += (sys.getsizeof(o) + 15) // 16 * 16
+        stack.extend(gc.get_referents(o))
+    return total
+
+class SessionState:
+    """Per-conversation state: context ring buffer, round-robin counters and active tag."""
+    __slots__ = ("sid", "context", "round_robin", "active_tag", "last_seen", "text_max")
+
+    def __init__(self, sid, context_max=8, rr_max=128, text_max=512):
+        self.sid = sid
+        self.context = deque(maxlen=context_max)
+        self.round_robin = RoundRobinStore(rr_max)
+        self.active_tag = "auto"
+        self.last_seen = time.monotonic()
+        self.text_max = text_max
+
+    def push(self, who, text):
+        who = (who or "")[:SESSION_WHO_MAX]
+        text = text or ""
+        if len(text) > self.text_max:
+            # keep head and tail: the tail carries the '— Tag: x' marker of summaries
+            half = self.text_max // 2
+            text = text[:half] + "…" + text[-(self.text_max - half - 1):]
+        self.context.append((who, text))
+
+    def to_dict(self):
+        return {
+            "sid": self.sid,
+            "context": [list(c) for c in self.context],
+            "round_robin": self.round_robin.to_list(),
+            "active_tag": self.active_tag,
+        }
+
+class SessionManager:
+    """
+    Holds many SessionState objects with a hard cap on their number and size.
+    Least recently used sessions are evicted past max_sessions, idle ones by evict_idle().
+    Memory bounds assume session ids of at most 64 characters.
+    """
+    def __init__(self, max_sessions=4096, idle_timeout=1800, context_max=8, rr_max=128, text_max=512, snapshot_path=None):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.context_max = context_max
+        self.rr_max = rr_max
+        self.text_max = text_max
+        self.snapshot_path = snapshot_path
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, sid):
+        return sid in self._sessions
+
+    def get(self, sid):
+        s = self._sessions.get(sid)
+        if s is None:
+            s = SessionState(sid, self.context_max, self.rr_max, self.text_max)
+            self._sessions[sid] = s
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(sid)
+        s.last_seen = time.monotonic()
+        return s
+
+    def drop(self, sid):
+        self._sessions.pop(sid, None)
+
+    def evict_idle(self, now=None):
+        """Drop sessions unused for idle_timeout seconds; returns how many were dropped."""
+        now = time.monotonic() if now is None else now
+        dropped = 0
+        # ordered by last use, so stop at the first session that is still fresh
+        while self._sessions:
+            sid, s = next(iter(self._sessions.items()))
+            if now - s.last_seen < self.idle_timeout:
+                break
+            self._sessions.popitem(last=False)
+            dropped += 1
+        return dropped
+
+    def session_bytes_bound(self):
+        """
+        Upper bound (bytes) of one session, measured on a fully used one: every context
+        slot and round-robin counter filled, worst-case 4-byte characters and big ints,
+        plus the session's slot in the manager.
+        """
+        s = SessionState("\U0001F600" * 64, self.context_max, self.rr_max, self.text_max)
+        s.active_tag = "\U0001F600" * 64
+        for i in range(self.context_max):
+            s.push("\U0001F600" * SESSION_WHO_MAX + str(i), "\U0001F600" * (self.text_max + 1) + str(i))
+        # evictions leave dummy slots, so the table peaks somewhere during churn
+        rr_peak = 0
+        step = max(1, self.rr_max // 8)
+        for i in range(4 * self.rr_max):
+            s.round_robin[("q%d" % i, "")] = (1 << 60) + i
+            if i % step == 0 or i == 4 * self.rr_max - 1:
+                rr_peak = max(rr_peak, _deep_sizeof(s.round_robin))
+        rest = _deep_sizeof(s) - _deep_sizeof(s.round_robin)
+        slot = sys.getsizeof(OrderedDict((i, None) for i in range(2))) - sys.getsizeof(OrderedDict((i, None) for i in range(1)))
+        return rest + rr_peak + max(slot, 0) + 64
+
+    def memory_bound(self):
+        # the session table itself: a full table plus its replacement while it resizes
+        table = sys.getsizeof(OrderedDict((i, None) for i in range(self.max_sessions)))
+        return self.max_sessions * self.session_bytes_bound() + 2 * table
+
+    def snapshot(self, path=None):
+        path = path or self.snapshot_path
+        if not path:
+            return None
+        data = {"sessions": [s.to_dict() for s in self._sessions.values()]}
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        return path
+
+    def restore(self, path=None):
+        """Load sessions saved by snapshot(); missing or broken files are ignored."""
+        path = path or self.snapshot_path
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return 0
+        n = 0
+        for d in data.get("sessions", []):
+            if not isinstance(d, dict) or not isinstance(d.get("sid"), str):
+                continue
+            s = self.get(d["sid"])
+            s.context.clear()
+            for who, txt in d.get("context", []):
+                s.push(who, txt)
+            s.round_robin.load_list(d.get("round_robin", []))
+            s.active_tag = d.get("active_tag") or "auto"
+            n += 1
+        return n
+
+# ---------- Answer blob store ----------
+class AnswerRef:
+    """
+    Reference to an answer kept compressed in an AnswerStore; text() decompresses it.
+    The store counts live refs and drops a blob when its last ref goes away.
+    """
+    __slots__ = ("key", "store")
+
+    def __init__(self, key, store):
+        self.key = key
+        self.store = store
+
+    def __del__(self):
+        try:
+            self.store._release(self.key)
+        except Exception:
+            pass
+
+    def text(self):
+        return self.store.get(self.key)
+
+    def __str__(self):
+        return self.text()
+
+    def __bool__(self):
+        return self.store.length(self.key) > 0
+
+    def __eq__(self, other):
+        return isinstance(other, AnswerRef) and other.key == self.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"AnswerRef({self.key.hex()})"
+
+def _answer_digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+
+class AnswerStore:
+    """
+    Content-addressed store of compressed answers (identical answers share one blob).
+    codec is "zlib" (raw deflate, optionally with a preset dictionary from train())
+    or "lzma". put() only hands out a ref when the blob plus its bookkeeping is
+    smaller than the plain str; otherwise the text itself is returned. Decompressed
+    texts are cached in a small LRU.
+    """
+    def __init__(self, codec="zlib", level=6, cache_size=64, min_size=48):
+        self.codec = codec
+        self.level = level
+        self.min_size = min_size
+        self.zdict = None
+        self._blobs = {}  # key -> [codec, payload, char length, live refs]
+        self._cache = BoundedLRU(cache_size)
+        # per stored answer: the ref, its key, the blob list, the payload header,
+        # the length int and the dict slot
+        self.overhead = (sys.getsizeof(AnswerRef(b"", None)) + sys.getsizeof(b"\0" * 8)
+                         + sys.getsizeof([None] * 4) + sys.getsizeof(b"") + sys.getsizeof(1 << 20) + 48)
+
+    def __len__(self):
+        return len(self._blobs)
+
+    def _compress(self, raw):
+        if self.codec == "lzma":
+            return "lzma", lzma.compress(raw, format=lzma.FORMAT_RAW, filters=[{"id": lzma.FILTER_LZMA2, "preset": self.level}])
+        kw = {"zdict": self.zdict} if self.zdict else {}
+        c = zlib.compressobj(self.level, zlib.DEFLATED, -15, **kw)
+        return ("zd" if self.zdict else "z"), c.compress(raw) + c.flush()
+
+    def _decompress(self, codec, payload):
+        if codec == "lzma":
+            return lzma.decompress(payload, format=lzma.FORMAT_RAW, filters=[{"id": lzma.FILTER_LZMA2}])
+        d = zlib.decompressobj(-15, zdict=self.zdict) if codec == "zd" else zlib.decompressobj(-15)
+        return d.decompress(payload) + d.flush()
+
+    def put(self, text):
+        """Return an AnswerRef for text, or text itself when compressing it saves nothing."""
+        text = text or ""
+        key = _answer_digest(text)
+        blob = self._blobs.get(key)
+        if blob is None:
+            raw = text.encode("utf-8")
+            if len(raw) < self.min_size:
+                return text
+            codec, payload = self._compress(raw)
+            if len(payload) + self.overhead >= sys.getsizeof(text):
+                return text
+            blob = self._blobs[key] = [codec, payload, len(text), 0]
+        blob[3] += 1
+        return AnswerRef(key, self)
+
+    def _release(self, key):
+        blob = self._blobs.get(key)
+        if blob is None:
+            return
+        blob[3] -= 1
+        if blob[3] <= 0:
+            del self._blobs[key]
+            self._cache.pop(key, None)
+
+    def get(self, key):
+        text = self._cache.get(key)
+        if text is None:
+            codec, payload = self._blobs[key][:2]
+            text = self._decompress(codec, payload).decode("utf-8")
+            self._cache[key] = text
+        return text
+
+    def length(self, key):
+        return self._blobs[key][2]
+
+    def train(self, samples, size=16384):
+        """
+        Build a zlib preset dictionary from frequent words of samples and recompress
+        the stored blobs with it. Most frequent words go last, where deflate finds them cheapest.
+        """
+        words = Counter()
+        for t in samples:
+            words.update(w + " " for w in re.findall(r"\w{3,}", answer_text(t) or ""))
+        ranked = sorted(words, key=lambda w: (words[w] * len(w), w))
+        zdict = "".join(w for w in ranked if words[w] > 1).encode("utf-8")[-size:]
+        texts = {k: self.get(k) for k in self._blobs}
+        self.zdict = zdict or None
+        self._cache.clear()
+        for k, t in texts.items():
+            self._blobs[k][:2] = self._compress(t.encode("utf-8"))
+
+    def stats(self):
+        raw = sum(len(self.get(k).encode("utf-8")) for k in self._blobs)
+        stored = sum(len(b[1]) for b in self._blobs.values())
+        return {"answers": len(self._blobs), "refs": sum(b[3] for b in self._blobs.values()),
+                "raw_bytes": raw, "stored_bytes": stored, "dict_bytes": len(self.zdict or b"")}
+
+ANSWER_STORE = AnswerStore()
+
+def answer_text(value):
+    """Plain text of a 'cavab' value, whether it is a str or an AnswerRef."""
+    return value.text() if isinstance(value, AnswerRef) else value
+
+def answer_key(value):
+    """Content key of a 'cavab' value without decompressing it."""
+    return value.key if isinstance(value, AnswerRef) else _answer_digest(value or "")
+
+def pack_entries(entries, store=None):
+    """Move plain-text answers of entries into the store, in place, where that saves memory."""
+    store = store or ANSWER_STORE
+    for it in entries:
+        v = it.get("cavab")
+        if isinstance(v, str):
+            it["cavab"] = store.put(v)
+
+def _json_default(obj):
+    if isinstance(obj, AnswerRef):
+        return obj.text()
+    raise TypeError(f"{type(obj).__name__} JSON-a çevrilə bilməz")
+
+# ---------- DB hot reload ----------
+def _entry_key(it):
+    return (it.get("sual",""), (it.get("tag") or "").strip(), answer_key(it.get("cavab","")))
+
+def _question_key(key):
+    return (normalize_text(key[0]), normalize_text(key[1]))
+
+def _user_entry_keys(entries):
+    # tag summaries are derived from the other entries, so they never take part in a merge
+    return Counter(_entry_key(it) for it in entries if not _is_tag_summary(it))
+
+class DBWatcher:
+    """
+    Watches the db file for changes made outside this process.
+    poll() only stats the file; the content is read when mtime/size moved and parsed
+    only when its hash differs from the last synced version. sync() then merges the
+    entry-level diff into the in-memory db (three-way, against the last synced state).
+    """
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._stat = None
+        self._hash = None
+        self._base = Counter()
+        self._base_meta = {}
+
+    def _read_stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _read_hash(self):
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+            return raw, hashlib.sha1(raw).hexdigest()
+        except OSError:
+            return None, None
+
+    def mark_synced(self, db, written=None):
+        """
+        Record db as the version on disk. After a save pass save_db()'s return value as
+        written, so the file is not re-read (another writer may have replaced it already).
+        """
+        if written:
+            self._stat, self._hash = written
+        else:
+            self._stat = self._read_stat()
+            _, self._hash = self._read_hash()
+        self._base = _user_entry_keys(db.get("suallar", []))
+        self._base_meta = dict(db.get("meta", {}))
+
+    def poll(self):
+        """Return the parsed file when its content changed since the last sync, else None."""
+        st = self._read_stat()
+        if st is None or st == self._stat:
+            return None
+        raw, digest = self._read_hash()
+        if raw is None:
+            return None
+        if digest == self._hash:
+            self._stat = st
+            return None
+        try:
+            data = json.loads(raw.decode("utf-8"))
+        except Exception:
+            # probably caught mid-write; the next poll retries
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get("suallar"), list):
+            return None
+        self._stat, self._hash = st, digest
+        return data
+
+    def sync(self, db):
+        """
+        Merge external changes into db in place.
+        Returns None when nothing changed, else (added, removed, conflicts): the entries
+        added to / removed from db and the (sual, tag) keys changed on both sides.
+        Conflicting answers are all kept, so neither side's write is lost.
+        Tag summaries are left out of the diff and rebuilt for every tag the merge touched.
+        """
+        disk = self.poll()
+        if disk is None:
+            return None
+        entries = db.setdefault("suallar", [])
+        disk_c = _user_entry_keys(disk["suallar"])
+        mem_c = _user_entry_keys(entries)
+        disk_added, disk_removed = disk_c - self._base, self._base - disk_c
+        mem_added, mem_removed = mem_c - self._base, self._base - mem_c
+
+        conflicts = set()
+        if mem_added or mem_removed:
+            def by_question(*counters):
+                out = {}
+                for c in counters:
+                    for k in c:
+                        out.setdefault(_question_key(k), set()).add(k)
+                return out
+            dq = by_question(disk_added, disk_removed)
+            mq = by_question(mem_added, mem_removed)
+            conflicts = {q for q in dq.keys() & mq.keys() if dq[q] != mq[q]}
+
+        pool = {}
+        for it in entries:
+            pool.setdefault(_entry_key(it), []).append(it)
+        if not (mem_added or mem_removed):
+            # no local edits: adopt the file's order, reusing unchanged entry objects
+            new_entries = [pool[k].pop(0) if pool.get(k) else dict(it)
+                           for it, k in ((it, _entry_key(it)) for it in disk["suallar"])]
+        else:
+            drop = disk_removed - mem_removed
+            new_entries = []
+            for it in entries:
+                k = _entry_key(it)
+                if drop[k] > 0 and not _is_tag_summary(it):
+                    drop[k] -= 1
+                else:
+                    new_entries.append(it)
+            extra = disk_added - mem_added
+            for it in disk["suallar"]:
+                k = _entry_key(it)
+                if extra[k] > 0 and not _is_tag_summary(it):
+                    extra[k] -= 1
+                    new_entries.append(dict(it))
+
+        old_entries = list(entries)
+        entries[:] = new_entries
+        for tag in sorted({k[1] for k in disk_added + disk_removed if k[1]}):
+            update_tag_summary(db, tag, save=False)
+        kept = {id(it) for it in entries}
+        removed = [it for it in old_entries if id(it) not in kept]
+        old_ids = {id(it) for it in old_entries}
+        added = [it for it in entries if id(it) not in old_ids]
+        if disk.get("meta") and disk.get("meta") != self._base_meta:
+            db["meta"] = dict(disk["meta"])
+        self._base = disk_c
+        self._base_meta = dict(disk.get("meta") or {})
+        return added, removed, conflicts
+
 # ---------- GUI ----------
 class ChatGUI(tk.Tk):
     def __init__(self):
@@ -337,12 +1582,31 @@ class ChatGUI(tk.Tk):
         self.geometry("920x560")
         self.minsize(720, 480)
         self.db = ensure_db()
-        self.context = []
+        # answers stay compressed in memory until shown
+        ANSWER_STORE.train(it.get("cavab","") for it in self.db.get("suallar", []))
+        pack_entries(self.db.get("suallar", []))
+        self.pipeline = MATCHER_PIPELINE
+        self.pipeline.spell_index.rebuild(it.get("sual","") for it in self.db.get("suallar", []))
         self.context_max = 8
-        self.round_robin = {}
-        self.active_tag = "auto"
+        self.sessions = SessionManager(context_max=self.context_max, snapshot_path=SESSIONS_PATH)
+        self.sessions.restore()
+        self.session = self.sessions.get("gui")
+        # the chat window starts empty, so only tag and round-robin carry over
+        self.session.context.clear()
+        self.session_housekeeping_ms = 60000
+        self.db_watch = DBWatcher(DB_PATH)
+        self.db_watch.mark_synced(self.db)
+        self.db_poll_ms = 2000
+        load_hot_queries()
+        self._db_poll_paused = False
         self.tag_cutoff = 0.55  # threshold for inferring tag from user's question
         self._build_ui()
+        if self.active_tag in self.tag_combo['values']:
+            self.tag_var.set(self.active_tag)
+        else:
+            self.active_tag = "auto"
+        self.after(self.db_poll_ms, self._poll_db)
+        self.after(self.session_housekeeping_ms, self._session_housekeeping)
 
     def _build_ui(self):
         # menus
@@ -456,6 +1720,74 @@ class ChatGUI(tk.Tk):
             except Exception:
                 _set_app_icon(self, LOCAL_DEFAULT_LOGO)
 
+    # Session state (the GUI drives a single session)
+    def _session_housekeeping(self):
+        try:
+            self.sessions.get("gui")  # the open window is never idle
+            self.sessions.evict_idle()
+            self.sessions.snapshot()
+        except Exception:
+            pass
+        finally:
+            self.after(self.session_housekeeping_ms, self._session_housekeeping)
+
+    @property
+    def context(self):
+        return self.session.context
+
+    @property
+    def round_robin(self):
+        return self.session.round_robin
+
+    @property
+    def active_tag(self):
+        return self.session.active_tag
+
+    @active_tag.setter
+    def active_tag(self, value):
+        self.session.active_tag = value
+
+    # DB sync helpers
+    def _poll_db(self):
+        try:
+            # list indexes in open dialogs point into self.db["suallar"]
+            if not self._db_poll_paused:
+                self._sync_db()
+        finally:
+            self.after(self.db_poll_ms, self._poll_db)
+
+    def _sync_db(self):
+        """Merge changes other writers made to the db file into self.db."""
+        res = self.db_watch.sync(self.db)
+        if not res:
+            return
+        added, removed, conflicts = res
+        if conflicts:
+            # keep a copy of the other writer's version next to the merged one
+            b = backup_db()
+            self.status.set(f"Veritabanı xaricdən dəyişdi: {len(conflicts)} ziddiyyət, hər iki cavab saxlanıldı ({b}).")
+        else:
+            self.status.set(f"Veritabanı yenidən yükləndi: +{len(added)} / -{len(removed)}.")
+        self._on_db_changed(added, removed)
+
+    def _on_db_changed(self, added, removed):
+        """Keep derived state in step with entries added to / removed from self.db."""
+        pack_entries(added)
+        spell = self.pipeline.spell_index
+        for it in removed:
+            spell.remove_text(it.get("sual",""))
+        for it in added:
+            spell.add_text(it.get("sual",""))
+        invalidate_hot_queries(added, removed)
+        self._refresh_tag_combo()
+
+    def _save_db(self):
+        """Save self.db without overwriting changes another writer made meanwhile."""
+        self._sync_db()
+        written = save_db(self.db)
+        if written:
+            self.db_watch.mark_synced(self.db, written)
+
     # Tag helpers
     def _gather_tags(self):
         return _gather_tags_from_db(self.db)
@@ -502,14 +1834,13 @@ class ChatGUI(tk.Tk):
 
     # Logging / chat
     def _log(self, who, text):
+        text = answer_text(text)
         self.chat_display.configure(state="normal")
         self.chat_display.insert(tk.END, f"{who}: {text}\n")
         self.chat_display.configure(state="disabled")
         self.chat_display.see(tk.END)
         log_chat_line(f"{who}: {text}")
-        self.context.append((who, text))
-        if len(self.context) > self.context_max:
-            self.context.pop(0)
+        self.session.push(who, text)
 
     def _infer_tag_from_question(self, question):
         """
@@ -519,7 +1850,7 @@ class ChatGUI(tk.Tk):
         tags = _gather_tags_from_db(self.db)
         if not tags:
             return None
-        matches = fuzzy_best_matches(question, tags, limit=3)
+        matches = fuzzy_best_matches(question, tags, limit=3, cutoff=self.tag_cutoff)
         if not matches:
             return None
         best_tag, score = matches[0]
@@ -550,25 +1881,30 @@ class ChatGUI(tk.Tk):
 
         self._log("Siz", q)
         self.entry_var.set("")
-        ans = select_answer(q, self.db, context=self.context, cutoff=self.cut.get(), active_tag=self.active_tag, round_robin_store=self.round_robin)
-        if ans:
+        res = self.pipeline.run(q, self.db, context=self.context, cutoff=self.cut.get(), active_tag=self.active_tag, round_robin_store=self.round_robin)
+        if res.answer and not res.partial:
             # If the answer is actually a tag-summary (sual==tag), mark in output
-            self._log("Simfut", ans)
+            self._log("Simfut", res.answer)
             self.status.set("Cavab tapıldı.")
             return
+        if res.answer:
+            # the search was cut short, so a better match may exist: offer it, don't assert it
+            self._log("Simfut (təklif)", res.answer)
+            self.status.set(f"Axtarış yarımçıq qaldı ({res.elapsed * 1000:.0f} ms) — ən yaxşı tapılan göstərildi.")
+            return
         # show fuzzy candidates in list for manual pick
-        corpus = [it.get("sual","") for it in self.db.get("suallar", [])]
-        matches = fuzzy_best_matches(q, corpus, limit=5)
         self.match_list.delete(0, tk.END)
-        for m, score in matches:
+        for m, score in res.matches:
             self.match_list.insert(tk.END, f"{m}  ({score:.2f})")
-        if matches and matches[0][1] >= self.cut.get():
-            best = matches[0][0]
-            for it in self.db.get("suallar", []):
-                if it.get("sual","") == best:
-                    self._log("Simfut (təklif)", it.get("cavab"))
-                    self.status.set(f"Təklif göstərildi (uyğunluq {matches[0][1]:.2f}).")
-                    return
+        if res.suggestion:
+            self._log("Simfut (təklif)", res.suggestion)
+            self.status.set(f"Təklif göstərildi (uyğunluq {res.matches[0][1]:.2f}).")
+            return
+        if res.timed_out or res.partial:
+            # out of time: don't offer teaching for a question we never fully searched
+            self._log("Simfut", "Hələ düşünürəm... Sualı bir az fərqli yazmağa çalışın.")
+            self.status.set(f"Vaxt limiti aşıldı ({res.elapsed * 1000:.0f} ms).")
+            return
         # else ask to teach
         self.status.set("Yeni sual — öyrətmək üçün pəncərə açılır.")
         self._teach_dialog(q)
@@ -596,12 +1932,14 @@ class ChatGUI(tk.Tk):
             if normalize_text(it.get("sual","")) == normalized:
                 if not messagebox.askyesno("Duplicate", "Belə bir sual artıq var. Üzərinə yazılsın?"):
                     return
-                it.update({"cavab": td.result["cavab"], "tag": td.result.get("tag","")})
-                save_db(self.db)
+                it.update({"cavab": ANSWER_STORE.put(td.result["cavab"]), "tag": td.result.get("tag","")})
                 # update tag summary if tag present
                 tag_val = td.result.get("tag","").strip()
                 if tag_val:
-                    update_tag_summary(self.db, tag_val)
+                    before = len(self.db["suallar"])
+                    update_tag_summary(self.db, tag_val, save=False)
+                    self._on_db_changed(self.db["suallar"][before:], [])
+                self._save_db()
                 self._log("Simfut", "Mövcud sual yeniləndi.")
                 if td.result.get("send_now"):
                     self._log("Simfut (yeni)", td.result["cavab"])
@@ -609,20 +1947,25 @@ class ChatGUI(tk.Tk):
                 return
         # add new entry
         new_tag = td.result.get("tag","").strip()
-        self.db.setdefault("suallar", []).append({"sual": question, "cavab": td.result["cavab"], "tag": new_tag})
-        save_db(self.db)
+        before = len(self.db.setdefault("suallar", []))
+        self.db["suallar"].append({"sual": question, "cavab": ANSWER_STORE.put(td.result["cavab"]), "tag": new_tag})
         # update tag summary automatically
         if new_tag:
-            update_tag_summary(self.db, new_tag)
+            update_tag_summary(self.db, new_tag, save=False)
+        self._on_db_changed(self.db["suallar"][before:], [])
+        self._save_db()
         self._log("Simfut", "Yeni sual əlavə edildi.")
         if td.result.get("send_now"):
             self._log("Simfut (yeni)", td.result["cavab"])
-        self._refresh_tag_combo()
 
     def _manage(self):
         md = ManageDialog(self, self.db)
-        self.wait_window(md)
-        save_db(self.db)
+        self._db_poll_paused = True
+        try:
+            self.wait_window(md)
+        finally:
+            self._db_poll_paused = False
+        self._save_db()
         self._log("Simfut", "Veritabanı yeniləndi.")
         self._refresh_tag_combo()
 
@@ -641,7 +1984,12 @@ class ChatGUI(tk.Tk):
                 data = json.load(fh)
             if isinstance(data, dict) and "suallar" in data:
                 self.db = data
-                save_db(self.db)
+                pack_entries(self.db["suallar"])
+                self.pipeline.spell_index.rebuild(it.get("sual","") for it in self.db["suallar"])
+                HOT_QUERIES.clear()  # mined against the previous db
+                written = save_db(self.db)
+                if written:
+                    self.db_watch.mark_synced(self.db, written)
                 messagebox.showinfo("Restore", "Uğurla yükləndi.")
                 self._refresh_tag_combo()
         except Exception as e:
@@ -657,6 +2005,10 @@ class ChatGUI(tk.Tk):
 
     def _on_exit(self):
         if messagebox.askyesno("Çıxış", "Çıxmaq istəyirsiniz?"):
+            try:
+                self.sessions.snapshot()
+            except Exception:
+                pass
             self.destroy()
 
 # ---------- TeachDialog and ManageDialog ----------
@@ -709,13 +2061,19 @@ class ManageDialog(tk.Toplevel):
         ttk.Button(fr, text="Yenilə", command=self._refresh).pack(side=tk.LEFT)
         ttk.Button(fr, text="Yeni", command=self._new).pack(side=tk.LEFT, padx=6)
         ttk.Button(fr, text="Sil", command=self._delete).pack(side=tk.LEFT, padx=6)
-        ttk.Button(fr, text="Diskə yaz", command=lambda: save_db(self.db)).pack(side=tk.RIGHT)
+        ttk.Button(fr, text="Diskə yaz", command=self._save).pack(side=tk.RIGHT)
         ttk.Label(right, text="Preview").pack(anchor="w")
         self.preview = tk.Text(right, height=12, state="disabled", font=("Consolas",10)); self.preview.pack(fill=tk.X)
         ttk.Button(right, text="Göndər Chat-ə", command=self._send_to_chat).pack(fill=tk.X, pady=(8,0))
         ttk.Button(right, text="Axtar", command=self._search).pack(fill=tk.X, pady=4)
         self.lb.bind("<<ListboxSelect>>", self._on_select)
 
+    def _save(self):
+        # saving merges external edits first, which may reorder self.db["suallar"]
+        self.master._save_db()
+        self._refresh()
+        self.preview.configure(state="normal"); self.preview.delete("1.0", tk.END); self.preview.configure(state="disabled")
+
     def _refresh(self):
         self.lb.delete(0, tk.END)
         for i,it in enumerate(self.db.get("suallar", [])):
@@ -729,7 +2087,7 @@ class ManageDialog(tk.Toplevel):
         if not sel: return
         idx = sel[0]; it = self.db["suallar"][idx]
         self.preview.configure(state="normal"); self.preview.delete("1.0", tk.END)
-        self.preview.insert(tk.END, f"Sual:\n{it.get('sual')}\n\nCavab:\n{it.get('cavab')}\n\nTag: {it.get('tag','')}")
+        self.preview.insert(tk.END, f"Sual:\n{it.get('sual')}\n\nCavab:\n{answer_text(it.get('cavab'))}\n\nTag: {it.get('tag','')}")
         self.preview.configure(state="disabled")
 
     def _new(self):
@@ -738,25 +2096,28 @@ class ManageDialog(tk.Toplevel):
         a = simpledialog.askstring("Yeni cavab", "Cavab:")
         if a is None: return
         tag = simpledialog.askstring("Tag", "Tag (isteğe bağlı):", initialvalue="")
-        self.db.setdefault("suallar", []).append({"sual": q, "cavab": a, "tag": tag or ""})
+        before = len(self.db.setdefault("suallar", []))
+        self.db["suallar"].append({"sual": q, "cavab": ANSWER_STORE.put(a), "tag": tag or ""})
         # if tag present, update summary
         if tag:
-            update_tag_summary(self.db, tag)
-        self._refresh()
+            update_tag_summary(self.db, tag, save=False)
+        self.master._on_db_changed(self.db["suallar"][before:], [])
+        self._save()
 
     def _delete(self):
         sel = self.lb.curselection()
         if not sel: return
         if messagebox.askyesno("Silmək", "Silmək istədiyinizə əminsiniz?"):
             # capture tag of deleted item to update summary later
-            tag_of = self.db["suallar"][sel[0]].get("tag","")
+            removed = self.db["suallar"][sel[0]]
+            tag_of = removed.get("tag","")
             del self.db["suallar"][sel[0]]
-            save_db(self.db)
-            # update tag summary if needed
+            before = len(self.db["suallar"])
+            # update tag summary if needed (deleting the summary itself re-creates it)
             if tag_of:
-                update_tag_summary(self.db, tag_of)
-            self._refresh()
-            self.preview.configure(state="normal"); self.preview.delete("1.0", tk.END); self.preview.configure(state="disabled")
+                update_tag_summary(self.db, tag_of, save=False)
+            self.master._on_db_changed(self.db["suallar"][before:], [removed])
+            self._save()
 
     def _send_to_chat(self):
         sel = self.lb.curselection()
@@ -778,6 +2139,28 @@ class ManageDialog(tk.Toplevel):
         messagebox.showinfo("Tapılmadı", "Uyğun sual tapılmadı.")
 
 # ---------- Run ----------
+def _cli(argv):
+    """
+    Offline jobs: `--compact [db.json] [out.json]`,
+    `--mine-log [chat.log] [db.json] [hot.json] [min_count]`,
+    `--spell-stats [db.json] [max_distance]`.
+    Returns False when no job was requested.
+    """
+    if not argv:
+        return False
+    cmd, args = argv[0], argv[1:]
+    if cmd == "--compact":
+        run_compaction(*args[:2])
+        return True
+    if cmd == "--mine-log":
+        run_log_miner(*args[:4])
+        return True
+    if cmd == "--spell-stats":
+        run_spell_stats(*args[:2])
+        return True
+    return False
+
 if __name__ == "__main__":
-    app = ChatGUI()
-    app.mainloop()
+    if not _cli(sys.argv[1:]):
+        app = ChatGUI()
+        app.mainloop()